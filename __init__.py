@@ -1,5 +1,7 @@
 from .emulator import Emulator
 
-def setup(bot):
-    bot.add_cog(Emulator(bot))
+async def setup(bot):
+    cog = Emulator(bot)
+    await cog.initialize()
+    bot.add_cog(cog)
 
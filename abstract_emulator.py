@@ -5,13 +5,104 @@ Abstract contract of what a controller should do.
 :license: GPL-3.0, see LICENSE for more details.
 """
 from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import Executor
+import functools
 import logging
-from PIL import Image
-from typing import List
+import numpy as np
+import shutil
+import subprocess
+import sys
+from typing import TYPE_CHECKING, Tuple
 import math
 
+if TYPE_CHECKING:
+  # Only needed for annotations; PIL is imported when a GIF is encoded.
+  from PIL import Image
+
 log = logging.getLogger("red.emulator")
 
+# ffmpeg is optional; when it is on the PATH it is used to encode GIFs
+# because its palette generation is far faster than PIL's encoder.
+_FFMPEG = shutil.which("ffmpeg")
+
+# GIF frame delays are whole centiseconds, and players slow any delay of
+# 2cs or less down to about 10cs, so GIFs drop frames to about this rate.
+_GIF_FPS = 20
+
+
+@functools.lru_cache(maxsize=64)
+def _normalizeButtonName(buttonName:str) -> str:
+  """Return the key a button name is stored under.
+
+  Button names come from chat messages, so the same few names are looked
+  up over and over and it is worth caching. The result is interned so the
+  button dict can match keys by identity before comparing strings.
+
+  Parameters
+  ----------
+  buttonName: str
+      Name of the button as given by the caller.
+
+  Returns
+  -------
+  str
+      Lower cased, interned button name.
+  """
+  return sys.intern(buttonName.casefold())
+
+
+def _quantizeFrame(frame:np.ndarray) -> "Image.Image":
+  """Quantize an RGB frame to a 256 colour palette image.
+
+  Parameters
+  ----------
+  frame: np.ndarray
+      (height, width, 3) uint8 array of an RGB frame.
+
+  Returns
+  -------
+  Image
+      Palette (P mode) image of the frame.
+  """
+  from PIL import Image
+  return Image.fromarray(frame).quantize(colors=256, method=Image.FASTOCTREE)
+
+
+def _packRGB(rgb:np.ndarray) -> np.ndarray:
+  """Pack the last axis of an RGB array into one 0xRRGGBB integer.
+
+  Parameters
+  ----------
+  rgb: np.ndarray
+      (..., 3) uint8 array of RGB values.
+
+  Returns
+  -------
+  np.ndarray
+      (...) uint32 array of packed colours.
+  """
+  rgb = rgb.astype(np.uint32)
+  return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+def _unpackRGB(packed:np.ndarray) -> np.ndarray:
+  """Unpack 0xRRGGBB integers into RGB values, the reverse of _packRGB.
+
+  Parameters
+  ----------
+  packed: np.ndarray
+      (...) integer array of packed colours.
+
+  Returns
+  -------
+  np.ndarray
+      (..., 3) uint8 array of RGB values.
+  """
+  return np.stack(
+    ((packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF),
+    axis=-1).astype(np.uint8)
+
 # Exceptions for this class
 class AlreadyRunning(Exception):
   """Thrown when a controller is already running an emulator"""
@@ -50,34 +141,73 @@ class ButtonCode:
 class AbastractEmulator(ABC):
   """Represents how a controller should behave"""
   # Magic Methods
-  def __init__(self, fps:int=60):
+  def __init__(self, screenWidth:int, screenHeight:int, fps:int=60,
+      screenShotSeconds:float=20, screenPalette=None):
     # Save information
     self._fps = fps
-    self.__screenShots = [] 
+    # Keep every this many frames in GIFs, each shown for a whole
+    # number of centiseconds
+    self._gifFrameStep = max(1, int(round(fps / _GIF_FPS)))
+    self._gifFrameDelay = max(3, int(round(100 * self._gifFrameStep / fps))) * 10
+    self._screenWidth = screenWidth
+    self._screenHeight = screenHeight
+    # Screen shots are written into one contiguous ring buffer, so only
+    # the most recent screenShotSeconds of frames are kept.
+    # With a palette, frames are stored as one byte palette indices
+    # rather than three byte RGB.
+    shape = (int(math.ceil(screenShotSeconds * fps)), screenHeight, screenWidth)
+    self.__palette = None
+    self.__paletteFullWarned = False
+    if screenPalette is None:
+      shape += (3,)
+    else:
+      # Frames are captured here in RGB, up to a second at a time, before
+      # being mapped to the palette
+      self.__rgbFrames = np.empty(
+        (fps, screenHeight, screenWidth, 3), dtype=np.uint8)
+      self.__setPalette(np.array(screenPalette, dtype=np.uint8).reshape(-1, 3))
+    self.__screenShots = np.empty(shape, dtype=np.uint8)
+    self.__screenShotCount = 0
     self.__buttons = {}
+    self.__buttonNames = None
 
   @property
-  def buttonNames(self) -> List[str]:
+  def screenShotSeconds(self) -> float:
+    """Returns how many seconds of screen shots are kept
+
+    Returns
+    -------
+    float
+        Seconds of the most recent frames a GIF can be made from.
+    """
+    return len(self.__screenShots) / self._fps
+
+
+  @property
+  def buttonNames(self) -> Tuple[str, ...]:
     """Returns button names
 
     Returns
     -------
-    list[str]
-        List of button names
+    tuple[str]
+        Tuple of button names
     """
-    return [buttonName.lower() for buttonName in self.__buttons.keys()]
+    if self.__buttonNames is None:
+      # Keys are already normalized by _registerButton
+      self.__buttonNames = tuple(self.__buttons)
+    return self.__buttonNames
 
 
   @abstractmethod
-  def _abstractHoldButton(self, button:ButtonCode, numberOfSeconds:float) -> None:
+  def _abstractHoldButtonFrames(self, button:ButtonCode, numberOfFrames:int) -> None:
     """An abstract function for holding a button.
 
     Parameters
     ----------
     button: ButtonCode
         Button to be held down.
-    numberOfSeconds: float
-        Number of seconds to hold this button.
+    numberOfFrames: int
+        Number of frames to hold this button.
     """
     pass
 
@@ -103,13 +233,13 @@ class AbastractEmulator(ABC):
         Name of the button to get the code of.
     """
     try:
-      return self.__buttons[buttonName.lower()]
+      return self.__buttons[_normalizeButtonName(buttonName)]
     except KeyError:
       log.critical("{}: Unrecognized button \"{}\"".format(
         self.__class__.__name__,
         buttonName
       ))
-      raise ButtonNotReconized(buttonName)
+      raise ButtonNotRecognized(buttonName)
 
 
   def holdButton(self, buttonName:str, numberOfSeconds:float) -> None:
@@ -126,7 +256,9 @@ class AbastractEmulator(ABC):
     if numberOfSeconds < 0:
         raise ValueError("numberOfSeconds must be greater than 0")
     button = self._getButton(buttonName)
-    self._abstractHoldButton(button, numberOfSeconds)
+    # Convert once so backends only ever deal in whole frames
+    numberOfFrames = int(math.ceil(numberOfSeconds * self._fps))
+    self._abstractHoldButtonFrames(button, numberOfFrames)
 
 
   def pressButton(self, buttonName:str) -> None:
@@ -150,7 +282,8 @@ class AbastractEmulator(ABC):
     button: ButtonCode
        Button to register to this emulator. 
     """
-    self.__buttons[button.name.lower()] = button
+    self.__buttons[_normalizeButtonName(button.name)] = button
+    self.__buttonNames = None
 
   
   # Running
@@ -176,9 +309,43 @@ class AbastractEmulator(ABC):
     if numberOfFrames == 0:
       return
 
-    for _ in range(numberOfFrames):
-      self._runForOneFrame()
-      self._takeScreenShot()
+    # Frames are run and captured in chunks that fit in the ring buffer
+    # without wrapping, so each chunk is a single contiguous slice.
+    capacity = len(self.__screenShots)
+    while numberOfFrames > 0:
+      index = self.__screenShotCount % capacity
+      count = min(numberOfFrames, capacity - index)
+      if self.__palette is None:
+        self._abstractRunAndCapture(count, self.__screenShots[index:index + count])
+      else:
+        count = min(count, len(self.__rgbFrames))
+        rgbFrames = self.__rgbFrames[:count]
+        self._abstractRunAndCapture(count, rgbFrames)
+        self.__screenShots[index:index + count] = self.__paletteIndices(rgbFrames)
+      self.__screenShotCount += count
+      numberOfFrames -= count
+
+
+  def _abstractRunAndCapture(self, numberOfFrames:int, buffer:np.ndarray) -> None:
+    """Run frames, writing a screen shot of each one into buffer.
+
+    Backends that can run several frames natively and copy their frame
+    buffers in bulk may override this. By default frames are run and
+    captured one at a time.
+
+    Parameters
+    ----------
+    numberOfFrames: int
+        Number of frames to run.
+    buffer: np.ndarray
+        (numberOfFrames, height, width, 3) uint8 array to write the RGB
+        screen shots into.
+    """
+    step = self._runForOneFrame
+    capture = self._abstractTakeScreenShotInto
+    for frame in buffer[:numberOfFrames]:
+      step()
+      capture(frame)
 
 
   def runForXSeconds(self, numberOfSeconds:int) -> None:
@@ -200,45 +367,321 @@ class AbastractEmulator(ABC):
 
   # Screenshots
   @abstractmethod
-  def _abstractTakeScreenShot(self) -> Image:
+  def _abstractTakeScreenShotInto(self, buffer:np.ndarray) -> None:
     """Abstract method to take a screen shot of the emulator
 
-    Returns
-    -------
-    Image
-        The screen shot of the emulator
+    Parameters
+    ----------
+    buffer: np.ndarray
+        (height, width, 3) uint8 array to write the RGB screen shot into.
     """
     pass
 
 
-  def makeGIF(self, filePath) -> None:
+  def makeGIF(self, filePath, encoder:str="ffmpeg") -> None:
     """Make a GIF from the stored screen shots of this emulator.
 
     Parameters
     -------
-    filePath: str
-        File path to save the created GIF in.
+    filePath: str or file object
+        File path to save the created GIF in, or a binary file object to
+        write it to.
+    encoder: str
+        "ffmpeg" or "pil". ffmpeg falls back to PIL if it is not installed
+        or fails.
+    """
+    frames, palette = self.__popScreenShots(encoder, copy=False)
+    self.__encodeGIF(frames, palette, filePath, encoder)
+
+
+  async def makeGIFAsync(self, filePath, encoder:str="ffmpeg",
+      executor:Executor=None, captureExecutor:Executor=None) -> None:
+    """Make a GIF like makeGIF, but without blocking the event loop.
+
+    The stored screen shots are copied out and reset in captureExecutor,
+    then encoded in executor, so the emulator can keep running and
+    recording while the GIF is encoded.
+
+    Parameters
+    -------
+    filePath: str or file object
+        File path to save the created GIF in, or a binary file object to
+        write it to.
+    encoder: str
+        "ffmpeg" or "pil". ffmpeg falls back to PIL if it is not installed
+        or fails.
+    executor: Executor
+        Executor to encode in. Defaults to the event loop's default executor.
+    captureExecutor: Executor
+        Executor to copy the screen shots out in. This should be the one
+        running the emulator, so the copy can't overlap new screen shots
+        being written. Defaults to executor.
+    """
+    loop = asyncio.get_running_loop()
+    frames, palette = await loop.run_in_executor(
+      captureExecutor or executor,
+      functools.partial(self.__popScreenShots, encoder, copy=True))
+    await loop.run_in_executor(
+      executor, self.__encodeGIF, frames, palette, filePath, encoder)
+
+
+  def __popScreenShots(self, encoder:str, copy:bool) -> Tuple[np.ndarray, np.ndarray]:
+    """Check a GIF can be made, then take the stored screen shots and reset.
+
+    Parameters
+    ----------
+    encoder: str
+        Encoder the GIF will be made with.
+    copy: bool
+        Whether the frames must be a copy, rather than possibly a view of
+        the buffer that later screen shots will overwrite.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The frames, oldest first, and the palette they index into, which is
+        None if frames are stored as RGB.
     """
     self.assertIsRunning()
 
-    if len(self.__screenShots) == 0:
+    if encoder not in ("ffmpeg", "pil"):
+      raise ValueError("encoder must be \"ffmpeg\" or \"pil\"")
+
+    if self.__screenShotCount == 0:
       raise NoScreenShotFramesSaved()
 
-    self.__screenShots[0].save(
+    frames = self.__orderedScreenShots(copy)
+    
+    # Reset values
+    self.__screenShotCount = 0
+    return frames, self.__palette
+
+
+  def __encodeGIF(self, frames:np.ndarray, palette:np.ndarray, filePath,
+      encoder:str) -> None:
+    """Encode frames into a GIF with the requested encoder.
+
+    Parameters
+    ----------
+    frames: np.ndarray
+        Frames as returned by __popScreenShots.
+    palette: np.ndarray
+        (colours, 3) uint8 palette the frames index into, or None.
+    filePath: str or file object
+        File path or binary file object to save the created GIF in.
+    encoder: str
+        "ffmpeg" or "pil".
+    """
+    if encoder == "ffmpeg" and _FFMPEG is not None:
+      try:
+        self._encodeGIFWithFFmpeg(
+          frames if palette is None else palette[frames],
+          filePath)
+        return
+      except (subprocess.CalledProcessError, OSError) as e:
+        # OSError covers ffmpeg vanishing or not being runnable; it has no
+        # stderr to report.
+        stderr = getattr(e, "stderr", None)
+        log.error("{}: ffmpeg failed, falling back to PIL: {}".format(
+          self.__class__.__name__,
+          stderr.decode(errors="replace").strip() if stderr else e
+        ))
+    self._encodeGIFWithPIL(frames, palette, filePath)
+
+
+  def _encodeGIFWithPIL(self, frames:np.ndarray, palette:np.ndarray,
+      filePath) -> None:
+    """Encode frames into a GIF with PIL.
+
+    Parameters
+    ----------
+    frames: np.ndarray
+        (frames, height, width, 3) uint8 array of RGB frames, or
+        (frames, height, width) palette indices if a palette is given.
+    palette: np.ndarray
+        (colours, 3) uint8 palette the frames index into, or None.
+    filePath: str or file object
+        File path or binary file object to save the created GIF in.
+    """
+    # Frames already in the palette need no quantizing at all.
+    if palette is not None:
+      images = (self.__paletteImage(frame, palette) for frame in frames)
+    else:
+      images = map(_quantizeFrame, frames)
+
+    next(images).save(
       filePath,
       format='GIF',
       loop=0, save_all=True,
-      append_images=self.__screenShots[1:],
-      duration=int(round(len(self.__screenShots) / self._fps)))
-    
-    # Reset values
-    self.__screenShots = [] 
+      append_images=images,
+      # Duration is per frame, in milliseconds
+      duration=self._gifFrameDelay,
+      optimize=True, disposal=2)
+
+
+  def _encodeGIFWithFFmpeg(self, frames:np.ndarray, filePath) -> None:
+    """Encode frames into a GIF by piping raw RGB frames to ffmpeg.
+
+    Parameters
+    ----------
+    frames: np.ndarray
+        (frames, height, width, 3) uint8 array of RGB frames.
+    filePath: str or file object
+        File path or binary file object to save the created GIF in.
+    """
+    # File objects are fed from ffmpeg's stdout.
+    toFile = hasattr(filePath, "write")
+    result = subprocess.run(
+      [
+        _FFMPEG, "-loglevel", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "rgb24",
+        "-s", "{}x{}".format(self._screenWidth, self._screenHeight),
+        "-r", str(1000 / self._gifFrameDelay),
+        "-i", "-",
+        "-filter_complex",
+        "split[a][b];[a]palettegen=stats_mode=diff[p];[b][p]paletteuse",
+        "-f", "gif", "pipe:1" if toFile else filePath
+      ],
+      input=memoryview(frames).cast("B"),
+      stdout=subprocess.PIPE if toFile else subprocess.DEVNULL,
+      stderr=subprocess.PIPE, check=True)
+    if toFile:
+      filePath.write(result.stdout)
 
     
-  def _takeScreenShot(self) -> None:
-    """Take and save a screen shot of the emulator"""
-    self.assertIsRunning()
-    self.__screenShots.append(self._abstractTakeScreenShot())
+  # Palette
+  def __setPalette(self, palette:np.ndarray) -> None:
+    """Set the palette and the sorted lookup used to index into it.
+
+    Parameters
+    ----------
+    palette: np.ndarray
+        (colours, 3) uint8 array of RGB palette entries.
+    """
+    keys = _packRGB(palette)
+    self.__palette = palette
+    self.__paletteOrder = np.argsort(keys).astype(np.uint8)
+    self.__paletteKeys = keys[self.__paletteOrder]
+
+
+  def __paletteIndices(self, frame:np.ndarray) -> np.ndarray:
+    """Map an RGB frame to palette indices.
+
+    Colours not yet in the palette are added, up to 256 colours; past that
+    they are mapped to the nearest colour in the palette.
+
+    Parameters
+    ----------
+    frame: np.ndarray
+        (..., height, width, 3) uint8 array of one or more RGB frames.
+
+    Returns
+    -------
+    np.ndarray
+        (..., height, width) uint8 array of palette indices.
+    """
+    packed = _packRGB(frame)
+    positions = np.searchsorted(self.__paletteKeys, packed)
+    np.minimum(positions, len(self.__paletteKeys) - 1, out=positions)
+    if np.array_equal(self.__paletteKeys[positions], packed):
+      return self.__paletteOrder[positions]
+
+    # Once the palette is full there is no room for new colours, so don't
+    # bother looking for them.
+    if len(self.__palette) < 256:
+      newKeys = np.setdiff1d(packed, self.__paletteKeys)
+      room = 256 - len(self.__palette)
+      if len(newKeys) > room:
+        if not self.__paletteFullWarned:
+          log.warning("{}: Screen palette is full, using the nearest colours for {} colours and any new ones".format(
+            self.__class__.__name__,
+            len(newKeys) - room
+          ))
+          self.__paletteFullWarned = True
+        newKeys = newKeys[:room]
+      self.__setPalette(np.concatenate((self.__palette, _unpackRGB(newKeys))))
+      positions = np.searchsorted(self.__paletteKeys, packed)
+      np.minimum(positions, len(self.__paletteKeys) - 1, out=positions)
+
+    indices = self.__paletteOrder[positions]
+    # Whatever still isn't in the palette gets the nearest colour that is.
+    missing = self.__paletteKeys[positions] != packed
+    if missing.any():
+      indices[missing] = self.__nearestPaletteIndices(packed[missing])
+    return indices
+
+
+  def __nearestPaletteIndices(self, packed:np.ndarray) -> np.ndarray:
+    """Find the palette colours nearest to some colours.
+
+    Parameters
+    ----------
+    packed: np.ndarray
+        (pixels,) uint32 array of packed colours.
+
+    Returns
+    -------
+    np.ndarray
+        (pixels,) uint8 array of indices of the nearest palette colour to
+        each, by squared RGB distance.
+    """
+    keys, inverse = np.unique(packed, return_inverse=True)
+    colours = _unpackRGB(keys).astype(np.int32)
+    palette = self.__palette.astype(np.int32)
+    nearest = np.empty(len(keys), dtype=np.uint8)
+    # Blocks bound the (colours, palette, 3) distance array's size.
+    for start in range(0, len(keys), 1024):
+      block = colours[start:start + 1024, np.newaxis, :] - palette[np.newaxis, :, :]
+      nearest[start:start + 1024] = np.einsum("ijk,ijk->ij", block, block).argmin(axis=1)
+    return nearest[inverse.reshape(-1)]
+
+
+  def __paletteImage(self, frame:np.ndarray, palette:np.ndarray) -> "Image.Image":
+    """Wrap a frame of palette indices in a P mode image.
+
+    Parameters
+    ----------
+    frame: np.ndarray
+        (height, width) uint8 array of palette indices.
+    palette: np.ndarray
+        (colours, 3) uint8 palette the frame indexes into.
+
+    Returns
+    -------
+    Image
+        P mode image using the given palette.
+    """
+    from PIL import Image
+    image = Image.fromarray(frame)
+    image.putpalette(palette.tobytes())
+    return image
+
+
+  def __orderedScreenShots(self, copy:bool=False) -> np.ndarray:
+    """Return the saved screen shots to put in a GIF, oldest first.
+
+    Only every _gifFrameStep-th frame is kept, ending at the newest.
+
+    Parameters
+    ----------
+    copy: bool
+        Always return a copy, never a view of the buffer.
+
+    Returns
+    -------
+    np.ndarray
+        (frames, height, width[, 3]) uint8 array. A view of the buffer if
+        no frames are dropped and the ring hasn't wrapped around, otherwise
+        a copy.
+    """
+    capacity = len(self.__screenShots)
+    count = min(self.__screenShotCount, capacity)
+    start = self.__screenShotCount % capacity if self.__screenShotCount > capacity else 0
+    step = self._gifFrameStep
+    if start == 0 and step == 1:
+      frames = self.__screenShots[:count]
+      return frames.copy() if copy else frames
+    return self.__screenShots[(start + np.arange((count - 1) % step, count, step)) % capacity]
 
 
 
@@ -314,8 +757,8 @@ class AbastractEmulator(ABC):
     
     Parameters
     ----------
-    saveStateFilePath: str
-        File path of the save the state to.
+    saveStateFilePath: str or file object
+        File path to save the state to, or a binary file object to write it to.
     """
     pass
 
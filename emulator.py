@@ -5,13 +5,21 @@ Redbot Cog for Interfacing with Emulators
 :license: GPL-3.0, see LICENSE for more details.
 """
 import asyncio
+from collections import Counter, defaultdict
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 from datetime import datetime
 import discord
 from discord.embeds import EmptyEmbed
+import functools
+import io
+import itertools
 import logging
 import re
 import os
-from typing import AsyncIterator, List
+import time
+from typing import AsyncIterator, Dict, List, Set
 from .gameBoy import GameBoy
 
 from redbot.core import checks, commands, Config
@@ -32,6 +40,50 @@ _ = Translator("Emulator", __file__)
 
 log = logging.getLogger("red.emulator")
 
+# Message templates shared by several commands, translated where they are used
+_NOT_EXIST_MSG = "{name} does not exist"
+_NAME_NOT_EXIST_MSG = "The name \"{name}\" does not exist"
+_NOT_RUNNING_MSG = "{name} has no instance running"
+_ALREADY_REGISTERED_MSG = "This channel is already registered to \"{name}\""
+
+# How to read the number of each action: parser, minimum and the
+# definition key holding the maximum
+_ACTIONS = {
+    "p": (lambda number: int(float(number)), 1, "pressMax"),
+    "h": (float, 0.5, "holdMax"),
+}
+# Longest message that is still considered as button input
+_MAX_INPUT_LENGTH = 32
+# Button inputs that may wait for an instance before new ones are ignored
+_INPUT_QUEUE_SIZE = 10
+# Inputs one user may have waiting at once, so no one can fill the queue
+_MAX_PENDING_PER_USER = 2
+# How long to wait for more input before playing a batch, in seconds
+_INPUT_COALESCE_SECONDS = 0.2
+# Game time each input takes to play, in seconds, given its number
+_INPUT_SECONDS = {
+    "p": lambda number: number * (1 + 2 / 60),
+    "h": lambda number: number + 1,
+}
+# How long an instance runs after playing a batch of input, in seconds
+_BATCH_RUN_SECONDS = 10
+
+# Seconds an instance runs for after starting, before the first screen shot
+_WARMUP_SECONDS = 60
+
+# Number of screen shots kept on disk for each definition
+_SCREEN_SHOTS_KEPT = 16
+
+# How long unloading waits for the emulators to save and stop, in seconds
+_UNLOAD_TIMEOUT = 30.0
+
+# Messages that may be sent to one channel per period, in seconds
+_SEND_RATE = 5
+_SEND_PERIOD = 5.0
+
+# How long a guild's embed colour is reused before asking the bot again, in seconds
+_EMBED_COLOUR_TTL = 60.0
+
 _DEFAULT_GLOBAL = {
     "local_path": None,
     "game_defs": {},
@@ -42,6 +94,105 @@ _DEFAULT_GLOBAL = {
 
 
 
+def _code_block(text:str) -> str:
+    """Wrap text in a code block.
+
+    Parameters
+    ----------
+    text: str
+        What goes in the block.
+
+    Returns
+    -------
+    str
+        The text as a code block.
+    """
+    return f"```\n{text}\n```\n"
+
+
+def _build_embed(colour:discord.Colour, *, title:str=EmptyEmbed, description:str=EmptyEmbed,
+        url:str=EmptyEmbed, timestamp:datetime=None, footer:str=None,
+        thumbnail:str=None, filename:str=None, embed:discord.Embed=None) -> discord.Embed:
+    """Assemble an embed.
+
+    Parameters
+    ----------
+    colour: discord.Colour
+        Colour of the embed, unless embed has its own.
+    title, description, url: str
+        Fields of the embed.
+    timestamp: datetime
+        Timestamp of the embed.
+    footer: str
+        Footer text of the embed.
+    thumbnail: str
+        URL of the embed's thumbnail.
+    filename: str
+        Name of an attached file to show as the embed's image.
+    embed: discord.Embed
+        Embed whose fields override the ones above.
+
+    Returns
+    -------
+    discord.Embed
+        The assembled embed.
+    """
+    contents = dict(title=title or EmptyEmbed, type="rich", url=url or EmptyEmbed,
+            description=description or EmptyEmbed)
+    if embed is None:
+        # The usual case, with nothing to merge, so skip the dict round trip.
+        embed = discord.Embed(colour=colour, **contents)
+    else:
+        embed = embed.to_dict()
+        colour = embed.get("color") or colour
+        contents.update(embed)
+        embed = discord.Embed.from_dict(contents)
+        embed.color = colour
+    if isinstance(timestamp, datetime):
+        embed.timestamp = timestamp
+    if footer:
+        embed.set_footer(text=footer)
+    if thumbnail:
+        embed.set_thumbnail(url=thumbnail)
+    if filename:
+        embed.set_image(url=f"attachment://{filename}")
+    return embed
+
+
+
+class _TokenBucket:
+    """Token bucket for limiting how often something may happen.
+
+    Parameters
+    ----------
+    rate: int
+        Number of tokens available per period, and the most that can be saved up.
+    period: float
+        Length of the period, in seconds.
+    """
+    def __init__(self, rate:int, period:float):
+        self._rate = rate
+        self._period = period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+
+    async def acquire(self) -> None:
+        """Take a token, waiting until one is available."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._rate,
+                        self._tokens + (now - self._updated) * self._rate / self._period)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self._period / self._rate)
+
+
+
 class Emulator(commands.Cog):
     """Emulator cog
     Allows users to play emulators together.
@@ -54,8 +205,79 @@ class Emulator(commands.Cog):
         self._instances = {}
         self._locks = {}
         self._patterns = {}
+        # Button usage help, per definition name
+        self._usage_messages: Dict[str, str] = {}
+        # Definition names that have run since their state was last saved
+        self._unsaved: Set[str] = set()
+        # Button inputs waiting to be played, and the task playing them, per definition name
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        # How many inputs each user has in the above queues, per definition name
+        self._pending_inputs: Dict[str, Counter] = {}
+        # A single thread per instance that all blocking emulator calls run in
+        self._emulator_pools: Dict[str, ThreadPoolExecutor] = {}
+        # Counts the screen shots taken, per definition name
+        self._screen_shot_counters: Dict[str, itertools.count] = defaultdict(itertools.count)
+        # Keeps the sends to each channel within Discord's rate limit
+        self._send_limiters: Dict[int, _TokenBucket] = defaultdict(
+                lambda: _TokenBucket(_SEND_RATE, _SEND_PERIOD))
+        # Embed colours and when they were looked up, per guild id
+        self._embed_colours: Dict[int, tuple] = {}
+        # In memory copy of the channels_to_defs config, keyed by channel id
+        self._channels_to_defs: Dict[int, str] = {}
+        # In memory copy of the defs_to_channels config, the reverse of the above
+        self._defs_to_channels: Dict[str, Set[int]] = {}
+        # In memory copy of the game_defs config, keyed by definition name
+        self._game_defs: Dict[str, dict] = {}
+        # In memory copy of the local_path config
+        self._local_path: str = None
+        # Folder listings and the modification time they were taken at, per path
+        self._dir_listings: Dict[str, tuple] = {}
+        # Shared by all blocking file system and GIF encoding work
+        self._io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="emulator-io")
+
+
+    async def initialize(self) -> None:
+        """Load the config values that are cached in memory."""
+        self._channels_to_defs = {
+            int(channel_id): def_name
+            for channel_id, def_name in (await self._conf.channels_to_defs()).items()
+        }
+        self._defs_to_channels = {
+            def_name: set(channel_ids)
+            for def_name, channel_ids in (await self._conf.defs_to_channels()).items()
+        }
+        self._game_defs = await self._conf.game_defs()
+        self._local_path = await self._conf.local_path()
 
     
+    def cog_unload(self) -> None:
+        """Stop any running emulators and release the cog's worker threads."""
+        for worker in self._workers.values():
+            worker.cancel()
+        futures = []
+        for def_name, instance in self._instances.items():
+            # Save and stop it in its own thread, after whatever it is in the
+            # middle of.
+            if instance.isRunning:
+                if def_name in self._unsaved:
+                    futures.append(self._emulator_pools[def_name].submit(
+                            self._write_main_state_file, def_name))
+                futures.append(self._emulator_pools[def_name].submit(instance.stop))
+            self._emulator_pools[def_name].shutdown(wait=False)
+        # Wait for them all at once, so a reload can't start a game while its
+        # old emulator is still running, but don't hang forever on one.
+        done, not_done = concurrent.futures.wait(futures, timeout=_UNLOAD_TIMEOUT)
+        for future in done:
+            if future.exception() is not None:
+                log.error("Failed to save or stop an instance on unload",
+                        exc_info=future.exception())
+        if not_done:
+            log.error("%d emulator jobs were still running after %s seconds of unloading",
+                    len(not_done), _UNLOAD_TIMEOUT)
+        self._io_pool.shutdown(wait=False)
+
+
     @commands.Cog.listener()
     async def on_ready(self):
         await self._auto_load_instances()
@@ -72,61 +294,57 @@ class Emulator(commands.Cog):
         """Listen to every message ever.
         This is how the bot will respond to button pushes.
         It will only respond if the message is sent within a registered channel though.
+        The cheap in memory checks run first, since the vast majority of
+        messages are not button input in a registered channel; the automod
+        check is only awaited for messages that are.
         """
+        if not self._channels_to_defs:
+            return
+        def_name = self._channels_to_defs.get(message.channel.id, None)
+        if def_name is None:
+            return
         if isinstance(message.channel, discord.abc.PrivateChannel):
             return
         author = message.author
         valid_user = isinstance(author, discord.Member) and not author.bot
         if not valid_user:
             return
+        # Too long to be button input, so don't bother matching it.
+        if len(message.content) > _MAX_INPUT_LENGTH:
+            return
+        # Is there an instance?
+        if self._instances.get(def_name, None) is None:
+            return
+        # Is it running?
+        if not self._instances[def_name].isRunning:
+            return
+        # They're talking to an existing instance, but is it important?
+        match = self._patterns[def_name].match(message.content)
+        if match is None:
+            return
+        # It's valid input
+        # Get rid of any capitalizations.
+        button = match.group("button").lower()
+        action = match.group("action").lower()
+        parse, minimum, maximum_key = _ACTIONS[action]
+        try:
+            num = min(self._game_defs[def_name][maximum_key], max(minimum, parse(match.group("number"))))
+        except ValueError:
+            return
+        # Only now is it worth the await.
         if await self.bot.is_automod_immune(message):
             return
 
-        channels_to_defs = await self._conf.channels_to_defs()
-        def_name = channels_to_defs.get(str(message.channel.id), None)
-        if def_name is not None:
-            # Is there an instance?
-            if self._instances.get(def_name, None) is None:
-                return
-            # Is it running?
-            if not self._instances[def_name].isRunning:
-                return
-            # They're talking to an existing instance, but is it important?
-            match = self._patterns[def_name].match(message.content)
-            if match is not None:
-                # It's valid input
-                game_defs = await self._conf.game_defs()
-                # Get rid of any capitalizations.
-                button = match.group("button").lower()
-                action = match.group("action").lower()
-                if action == 'p':
-                    try:
-                        num = min(game_defs[def_name]["pressMax"], max(1, int(float(match.group("number")))))
-                    except ValueError:
-                        return
-                elif action == 'h':
-                    try:
-                        num = min(game_defs[def_name]["holdMax"], max(0.5, float(match.group("number"))))
-                    except ValueError:
-                        return
-                else:
-                    raise ValueError(f"Unknown action was received: {action}")
-
-                # Only one may press the button.
-                if not self._locks[def_name].locked():
-                    async with self._locks[def_name]:
-                        if action == 'p':
-                            # Press button X times
-                            for n in range(num):
-                                self._instances[def_name].pressButton(button)
-                            title = f"{author.display_name} pressed \"{button}\" {num} time(s)"
-                        elif action == 'h':
-                            # Hold button for X seconds
-                            self._instances[def_name].holdButton(button, num)
-                            title=f"{author.display_name} held \"{button}\" for {num} second(s)"
-                        self._instances[def_name].runForXSeconds(10)
-                        await self._save_main_state_file(def_name)
-                        await self._send_screenshot(def_name, title=_(title))
+        # Hand it to the instance's input worker, unless it's backed up
+        # or this user already has their share of it waiting.
+        queue = self._queues.get(def_name, None)
+        if queue is None or queue.full():
+            return
+        pending = self._pending_inputs[def_name]
+        if pending[author.id] >= _MAX_PENDING_PER_USER:
+            return
+        pending[author.id] += 1
+        queue.put_nowait((author.id, author.display_name, button, action, num))
 
 
     # Commands
@@ -146,61 +364,48 @@ class Emulator(commands.Cog):
         definition_name: str
             Name of the game to register this channel to.
         """
-        game_defs = await self._conf.game_defs()
-        if game_defs.get(definition_name, None) is None: 
-            info_msg = "```\n"
-            info_msg += f"{definition_name} does not exist\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Improper Definition Name"),
-                    description=_(info_msg), error=True)
-
-        channels_to_defs = await self._conf.channels_to_defs()
-        if str(ctx.channel.id) in channels_to_defs.keys():
-            info_msg = "```\n"
-            info_msg += f"This channel is already registered to \"{def_name}\"\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Channel Already Register"),
-                    description=_(info_msg), error=True)
-
-        # Register to both
-        channels_to_defs[str(ctx.channel.id)] = definition_name
-        await self._conf.channels_to_defs.set(channels_to_defs)
-        defs_to_channels = await self._conf.defs_to_channels()
-        defs_to_channels[definition_name].append(ctx.channel.id)
-        await self._conf.defs_to_channels.set(defs_to_channels)
+        if not self._definition_exists(definition_name):
+            return await self._code_reply(ctx, _("Improper Definition Name"),
+                    _(_NOT_EXIST_MSG).format(name=definition_name), error=True)
+
+        def_name = self._channels_to_defs.get(ctx.channel.id, None)
+        if def_name is not None:
+            return await self._code_reply(ctx, _("Channel Already Register"),
+                    _(_ALREADY_REGISTERED_MSG).format(name=def_name), error=True)
+
+        # Register to both, writing only the changed keys back
+        self._channels_to_defs[ctx.channel.id] = definition_name
+        channel_ids = self._defs_to_channels.setdefault(definition_name, set())
+        channel_ids.add(ctx.channel.id)
+        await asyncio.gather(
+                self._conf.channels_to_defs.set_raw(str(ctx.channel.id), value=definition_name),
+                self._conf.defs_to_channels.set_raw(definition_name, value=list(channel_ids)))
         # Inform of success
-        info_msg = "```\n"
-        info_msg += f"Registered this channel to \"{definition_name}\"\n"
-        info_msg += "```\n"
-        return await self._embed_msg(ctx, title=_("Channel Registered"),
-                description=_(info_msg), success=True)
+        return await self._code_reply(ctx, _("Channel Registered"),
+                _("Registered this channel to \"{definition_name}\"").format(
+                        definition_name=definition_name), success=True)
 
 
     @commands.guild_only()
     @setup.command(name="unregister")
     async def setup_unregister(self, ctx: commands.Context):
         """Unregiseter the channel this message is sent from."""
-        channels_to_defs = await self._conf.channels_to_defs()
-        if str(ctx.channel.id) not in channels_to_defs.keys():
-            info_msg = "```\n"
-            info_msg += f"This channel isn't registered to anything\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Channel Not Registered"),
-                    description=_(info_msg), error=True)
+        def_name = self._channels_to_defs.get(ctx.channel.id, None)
+        if def_name is None:
+            return await self._code_reply(ctx, _("Channel Not Registered"),
+                    _("This channel isn't registered to anything"), error=True)
         
-        def_name = channels_to_defs[str(ctx.channel.id)]
-        del channels_to_defs[str(ctx.channel.id)]
-        await self._conf.channels_to_defs.set(channels_to_defs)
-        defs_to_channels = await self._conf.defs_to_channels()
-        defs_to_channels[def_name] = list(filter(lambda c_id: c_id != ctx.channel.id, defs_to_channels[def_name]))
-        await self._conf.defs_to_channels.set(defs_to_channels)
+        del self._channels_to_defs[ctx.channel.id]
+        channel_ids = self._defs_to_channels[def_name]
+        channel_ids.discard(ctx.channel.id)
+        await asyncio.gather(
+                self._conf.channels_to_defs.clear_raw(str(ctx.channel.id)),
+                self._conf.defs_to_channels.set_raw(def_name, value=list(channel_ids)))
 
         # Inform of success
-        info_msg = "```\n"
-        info_msg += f"This channel has been unregistered from \"{def_name}\"\n"
-        info_msg += "```\n"
-        return await self._embed_msg(ctx, title=_("Channel Unregistered"),
-                description=_(info_msg), success=True)
+        return await self._code_reply(ctx, _("Channel Unregistered"),
+                _("This channel has been unregistered from \"{def_name}\"").format(
+                        def_name=def_name), success=True)
 
 
     @setup.command(name="stop")
@@ -212,29 +417,19 @@ class Emulator(commands.Cog):
         definition_name: str
             Name of the game to stop.
         """
-        game_defs = await self._conf.game_defs()
-        if definition_name not in game_defs.keys():
-            info_msg = "```\n"
-            info_msg += f"{definition_name} does not exist\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Improper Definition Name"),
-                    description=_(info_msg), error=True)
+        if not self._definition_exists(definition_name):
+            return await self._code_reply(ctx, _("Improper Definition Name"),
+                    _(_NOT_EXIST_MSG).format(name=definition_name), error=True)
 
         # Does an instance actually exist?
         if self._instances.get(definition_name, None) is None:
-            info_msg = "```\n"
-            info_msg += f"{definition_name} has no instance running\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Instance Not Running"),
-                    description=_(info_msg), error=True)
+            return await self._code_reply(ctx, _("Instance Not Running"),
+                    _(_NOT_RUNNING_MSG).format(name=definition_name), error=True)
         
         # Is the instance actually running?
         if not self._instances[definition_name].isRunning:
-            info_msg = "```\n"
-            info_msg += f"{definition_name} has no instance running\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Instance Not Running"),
-                    description=_(info_msg), error=True)
+            return await self._code_reply(ctx, _("Instance Not Running"),
+                    _(_NOT_RUNNING_MSG).format(name=definition_name), error=True)
 
         await self._stop_instance(definition_name)
 
@@ -254,22 +449,16 @@ class Emulator(commands.Cog):
         definition_name: str
             Name of the game to start.
         """
-        game_defs = await self._conf.game_defs()
-        if definition_name not in game_defs.keys():
-            info_msg = "```\n"
-            info_msg += f"{definition_name} does not exist\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Improper Definition Name"),
-                    description=_(info_msg), error=True)
+        if not self._definition_exists(definition_name):
+            return await self._code_reply(ctx, _("Improper Definition Name"),
+                    _(_NOT_EXIST_MSG).format(name=definition_name), error=True)
 
         # Is it already running?
         if self._instances.get(definition_name, None) is not None:
             if self._instances[definition_name].isRunning:
-                info_msg = "```\n"
-                info_msg += f"{definition_name} already has an instance running\n"
-                info_msg += "```\n"
-                return await self._embed_msg(ctx, title=_("Instance is Already Running"),
-                        description=_(info_msg), error=True)
+                return await self._code_reply(ctx, _("Instance is Already Running"),
+                        _("{definition_name} already has an instance running").format(
+                                definition_name=definition_name), error=True)
 
         await self._start_instance(definition_name)
 
@@ -292,32 +481,26 @@ class Emulator(commands.Cog):
         press_max: int
             New maximum button pressing.
         """
-        game_defs = await self._conf.game_defs()
-        if game_defs.get(definition_name, None) is None: 
-            info_msg = "```\n"
-            info_msg += f"{definition_name} does not exist\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Improper Definition Name"),
-                    description=_(info_msg), error=True)
+        game_defs = self._game_defs
+        if not self._definition_exists(definition_name):
+            return await self._code_reply(ctx, _("Improper Definition Name"),
+                    _(_NOT_EXIST_MSG).format(name=definition_name), error=True)
 
         # Sanity check value
         if press_max < 1:
-            info_msg = "```\n"
-            info_msg += f"{press_max} is less than 1, which is not allowed\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Invalid New Press Max"),
-                    description=_(info_msg), error=True)
+            return await self._code_reply(ctx, _("Invalid New Press Max"),
+                    _("{press_max} is less than 1, which is not allowed").format(
+                            press_max=press_max), error=True)
 
         # Set new max
         game_defs[definition_name]["pressMax"] = press_max
-        await self._conf.game_defs.set(game_defs)
+        self._usage_messages.pop(definition_name, None)
+        await self._conf.game_defs.set_raw(definition_name, "pressMax", value=press_max)
 
         # Inform of success
-        info_msg = "```\n"
-        info_msg += f"Set press max for \"{definition_name}\" to {press_max}\n"
-        info_msg += "```\n"
-        return await self._embed_msg(ctx, title=_("Press Max Updated"),
-                description=_(info_msg), success=True)
+        return await self._code_reply(ctx, _("Press Max Updated"),
+                _("Set press max for \"{definition_name}\" to {press_max}").format(
+                        definition_name=definition_name, press_max=press_max), success=True)
 
 
     @commands.is_owner()
@@ -332,78 +515,62 @@ class Emulator(commands.Cog):
         hold_max: int
             New maximum button holding.
         """
-        game_defs = await self._conf.game_defs()
-        if game_defs.get(definition_name, None) is None: 
-            info_msg = "```\n"
-            info_msg += f"{definition_name} does not exist\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Improper Definition Name"),
-                    description=_(info_msg), error=True)
+        game_defs = self._game_defs
+        if not self._definition_exists(definition_name):
+            return await self._code_reply(ctx, _("Improper Definition Name"),
+                    _(_NOT_EXIST_MSG).format(name=definition_name), error=True)
 
         # Sanity check value
         if hold_max < 0.5:
-            info_msg = "```\n"
-            info_msg += f"{hold_max} is less than 0.5, which is not allowed\n"
-            info_msg += "```\n"
-            return await self._embed_msg(ctx, title=_("Invalid New Hold Max"),
-                    description=_(info_msg), error=True)
+            return await self._code_reply(ctx, _("Invalid New Hold Max"),
+                    _("{hold_max} is less than 0.5, which is not allowed").format(
+                            hold_max=hold_max), error=True)
 
         # Set new max
         game_defs[definition_name]["holdMax"] = hold_max
-        await self._conf.game_defs.set(game_defs)
+        self._usage_messages.pop(definition_name, None)
+        await self._conf.game_defs.set_raw(definition_name, "holdMax", value=hold_max)
 
         # Inform of success
-        info_msg = "```\n"
-        info_msg += f"Set hold max for \"{definition_name}\" to {hold_max}\n"
-        info_msg += "```\n"
-        return await self._embed_msg(ctx, title=_("Hold Max Updated"),
-                description=_(info_msg), success=True)
+        return await self._code_reply(ctx, _("Hold Max Updated"),
+                _("Set hold max for \"{definition_name}\" to {hold_max}").format(
+                        definition_name=definition_name, hold_max=hold_max), success=True)
 
 
     @setup.command(name="ROMs", aliases=["roms"])
     async def setup_roms(self, ctx: commands.Context):
         """List available ROMs"""
-        info_msg = "```\ngb\n"
-        for name, path in [("boots", await self.boots_dir()), ("games", await self.games_dir())]:
-            if not os.path.exists(path):
-                info_msg += f"|__ {name} :negative_squared_cross_mark: \n"
-            else:
-                info_msg += f"|__ {name} \n"
-                items = list(os.listdir(path))
-                if len(items) == 0:
-                    info_msg += f"\t|__ <NOTHING> \n"
-                else:
-                    for item in items: 
-                        info_msg += f"\t|__ {item} \n"
-        info_msg += "```" 
-
-        await self._embed_msg(ctx, title=_("Available ROMs"), description=_(info_msg), success=True)
+        # Listing the folders is blocking I/O, so do both at once off the event loop.
+        loop = asyncio.get_running_loop()
+        boots, games = await asyncio.gather(
+                loop.run_in_executor(self._io_pool, self._list_dir, self.boots_dir()),
+                loop.run_in_executor(self._io_pool, self._list_dir, self.games_dir()))
+        info_msg = self._roms_message(boots, games)
+        await self._embed_msg(ctx, title=_("Available ROMs"), description=info_msg, success=True)
 
 
     @setup.command(name="definitions", aliases=["defs"])
     async def setup_definitions(self, ctx: commands.Context) -> None:
         """List defined games."""
-        info_msg = "```\n"
-        game_defs = await self._conf.game_defs()
+        parts = ["```"]
+        game_defs = self._game_defs
         if len(game_defs) == 0:
-            info_msg += "NONE"
+            parts.append("NONE")
         else:
-            for definition in game_defs.keys():
-                info_msg += f"{definition}:\n"
-                info_msg += f"\t|__Boot ROM: {game_defs[definition]['bootROM']}\n"
-                info_msg += f"\t|__Game ROM: {game_defs[definition]['gameROM']}\n"
-        info_msg += "```" 
-        await self._embed_msg(ctx, title=_("Defined Games"), description=_(info_msg), success=True)
+            for definition, def_info in game_defs.items():
+                parts.append(f"{definition}:")
+                parts.append(f"\t|__Boot ROM: {def_info['bootROM']}")
+                parts.append(f"\t|__Game ROM: {def_info['gameROM']}")
+        parts.append("```")
+        info_msg = "\n".join(parts)
+        await self._embed_msg(ctx, title=_("Defined Games"), description=info_msg, success=True)
 
 
     @setup.command(name="list_auto_loads", aliases=["list_als"])
     async def setup_list_auto_loads(self, ctx: commands.Context) -> None:
         """List names in the auto load list."""
-        info_msg ="```\n"
-        for al in await self._conf.auto_loads():
-            info_msg += f"{al}\n"
-        info_msg += "```"
-        return await self._embed_msg(ctx, title=_("Auto Load List"), description=_(info_msg),
+        info_msg = "\n".join(["```", *await self._conf.auto_loads(), "```"])
+        return await self._embed_msg(ctx, title=_("Auto Load List"), description=info_msg,
                 success=True)
 
 
@@ -416,23 +583,17 @@ class Emulator(commands.Cog):
         definition_name: str
             Name for this game definition to add to the auto load list.
         """
-        game_defs = await self._conf.game_defs()
-        if definition_name not in game_defs.keys():
-            info_msg ="```\n"
-            info_msg += f"The name \"{definition_name}\" does not exist\n"
-            info_msg += "```"
-            return await self._embed_msg(ctx, title=_("Non-Existent Name"), description=_(info_msg),
-                    error=True)
+        if not self._definition_exists(definition_name):
+            return await self._code_reply(ctx, _("Non-Existent Name"),
+                    _(_NAME_NOT_EXIST_MSG).format(name=definition_name), error=True)
 
         auto_loads = await self._conf.auto_loads()
         auto_loads.append(definition_name)
         await self._conf.auto_loads.set(auto_loads)
 
-        info_msg ="```\n"
-        info_msg += f"Added \"{definition_name}\" to the auto load list\n"
-        info_msg += "```"
-        return await self._embed_msg(ctx, title=_("Added to List"), description=_(info_msg),
-                success=True)
+        return await self._code_reply(ctx, _("Added to List"),
+                _("Added \"{definition_name}\" to the auto load list").format(
+                        definition_name=definition_name), success=True)
 
 
     @setup.command(name="delete_auto_load", aliases=["del_al"])
@@ -444,29 +605,21 @@ class Emulator(commands.Cog):
         definition_name: str
             Name for this game definition to delete from the auto load list.
         """
-        game_defs = await self._conf.game_defs()
-        if definition_name not in game_defs.keys():
-            info_msg ="```\n"
-            info_msg += "The name \"{definition_name}\" does not exist\n"
-            info_msg += "```"
-            return await self._embed_msg(ctx, title=_("Non-Existent Name"), description=_(info_msg),
-                    error=True)
+        if not self._definition_exists(definition_name):
+            return await self._code_reply(ctx, _("Non-Existent Name"),
+                    _(_NAME_NOT_EXIST_MSG).format(name=definition_name), error=True)
 
         auto_loads = await self._conf.auto_loads()
         if not definition_name in auto_loads:
-            info_msg ="```\n"
-            info_msg += f"The name \"{definition_name}\" is not in the auto loads list.\n"
-            info_msg += "```"
-            return await self._embed_msg(ctx, title=_("Not in List"), description=_(info_msg),
-                    error=True)
-
-        await self._conf.auto_loads.set(list(filter(lambda dn: dn != definition_name, auto_loads)))
-
-        info_msg ="```\n"
-        info_msg += f"Removed \"{definition_name}\" from the auto load list\n"
-        info_msg += "```"
-        return await self._embed_msg(ctx, title=_("Removed from List"), description=_(info_msg),
-                success=True)
+            return await self._code_reply(ctx, _("Not in List"),
+                    _("The name \"{definition_name}\" is not in the auto loads list.").format(
+                            definition_name=definition_name), error=True)
+
+        await self._conf.auto_loads.set([dn for dn in auto_loads if dn != definition_name])
+
+        return await self._code_reply(ctx, _("Removed from List"),
+                _("Removed \"{definition_name}\" from the auto load list").format(
+                        definition_name=definition_name), success=True)
 
 
     @setup.command(name="set_definition", aliases=["set_def"])
@@ -483,42 +636,47 @@ class Emulator(commands.Cog):
            Game ROM for this game. Must actually exist. 
         """
         # Check that the ROMs exist
-        if not os.path.exists(await self.bootROM_path(bootROM)):
+        loop = asyncio.get_running_loop()
+        boot_exists, game_exists = await asyncio.gather(
+                loop.run_in_executor(self._io_pool, os.path.exists, self.bootROM_path(bootROM)),
+                loop.run_in_executor(self._io_pool, os.path.exists, self.gameROM_path(gameROM)))
+        if not boot_exists:
             return await self._embed_msg(
                 ctx,
                 title=_("Invalid Boot ROM"),
-                description=_(f"{bootROM} does not exist."),
+                description=_("{bootROM} does not exist.").format(bootROM=bootROM),
                 error=True
             )
 
-        if not os.path.exists(await self.gameROM_path(gameROM)):
+        if not game_exists:
             return await self._embed_msg(
                 ctx,
                 title=_("Invalid Game ROM"),
-                description=_(f"{gameROM} does not exist."),
+                description=_("{gameROM} does not exist.").format(gameROM=gameROM),
                 error=True
             )
 
         # Check that this name has not already been used
-        game_defs = await self._conf.game_defs()
-        if definition_name in game_defs.keys():
+        game_defs = self._game_defs
+        if self._definition_exists(definition_name):
             return await self._embed_msg(
                 ctx,
                 title=_("Name Conflict"),
-                description=_(f"{definition_name} already exist as a name."),
+                description=_("{definition_name} already exist as a name.").format(
+                    definition_name=definition_name),
                 error=True
             )
         # Set the definition
         game_defs[definition_name] = {"bootROM": bootROM, "gameROM": gameROM, "pressMax": 3, "holdMax": 3.0}
-        await self._conf.game_defs.set(game_defs)
         # Create the list of registered channels
-        defs_to_channels = await self._conf.defs_to_channels()
-        defs_to_channels[definition_name] = list()
-        await self._conf.defs_to_channels.set(defs_to_channels)
+        self._defs_to_channels[definition_name] = set()
+        await asyncio.gather(
+                self._conf.game_defs.set_raw(definition_name, value=game_defs[definition_name]),
+                self._conf.defs_to_channels.set_raw(definition_name, value=[]))
         return await self._embed_msg(
             ctx,
             title=_("Saved Definition"),
-            description=_(f"Definition was saved successfully."),
+            description=_("Definition was saved successfully."),
             success=True
         )
 
@@ -534,12 +692,12 @@ class Emulator(commands.Cog):
         definition_name: str
             Name of the game to delete.
         """
-        game_defs = await self._conf.game_defs()
-        if definition_name not in game_defs.keys():
+        game_defs = self._game_defs
+        if not self._definition_exists(definition_name):
             return await self._embed_msg(
                 ctx,
                 title=_("No Such Definition"),
-                description=_(f"{name} does not exist."),
+                description=_("{definition_name} does not exist.").format(definition_name=definition_name),
                 error=True
             )
 
@@ -547,15 +705,13 @@ class Emulator(commands.Cog):
         info_msg = _(
                 "Are you sure you want to delete?:\n"
                 "```\n"
-                f"{definition_name}\n"
+                "{definition_name}\n"
                 "```\n"
-                )
+                ).format(definition_name=definition_name)
         info = await ctx.maybe_send_embed(info_msg)
-        start_adding_reactions(info, ReactionPredicate.YES_OR_NO_EMOJIS)
-        pred = ReactionPredicate.yes_or_no(info, ctx.author)
-        await ctx.bot.wait_for("reaction_add", check=pred)
+        confirmed = await self._confirm(ctx, info)
         # If user said no
-        if not pred.result:
+        if not confirmed:
             with contextlib.suppress(discord.HTTPException):
                 await info.delete()
             return
@@ -563,25 +719,33 @@ class Emulator(commands.Cog):
             # If an instance is running, shut it down
             if self._locks.get(definition_name, None) is not None:
                 async with self._locks[definition_name]:
-                    if self._instances.get(definition_name, None) is not None:
-                        if self._instances[definition_name].isRunning():
-                            self._instances[definition_name].stop()
+                    self._stop_input_worker(definition_name)
+                    instance = self._instances.get(definition_name, None)
+                    if instance is not None:
+                        if instance.isRunning:
+                            await self._run_in_emulator(definition_name, instance.stop)
+                        # Nothing will run in its thread again.
+                        self._emulator_pools.pop(definition_name).shutdown(wait=False)
+                        del self._instances[definition_name]
+                    self._patterns.pop(definition_name, None)
+                    self._unsaved.discard(definition_name)
+                    self._screen_shot_counters.pop(definition_name, None)
             # Delete it from the list
             del game_defs[definition_name]
-            await self._conf.game_defs.set(game_defs)
-            # Delete the channel registrations
-            defs_to_channels = await self._conf.defs_to_channels()
-            channels_to_defs = await self._conf.channels_to_defs()
-            for channel_id in channels_to_defs.keys():
-                del channels_to_defs[channel_id]
-            await self._conf.channels_to_defs.set(channels_to_defs)
-            del defs_to_channels[definition_name]
-            await self._conf.defs_to_channels.set(defs_to_channels)
+            self._usage_messages.pop(definition_name, None)
+            # Delete the channel registrations, only those of this definition
+            channel_ids = self._defs_to_channels.pop(definition_name, set())
+            for channel_id in channel_ids:
+                self._channels_to_defs.pop(channel_id, None)
+            await asyncio.gather(
+                    self._conf.game_defs.clear_raw(definition_name),
+                    self._conf.defs_to_channels.clear_raw(definition_name),
+                    *[self._conf.channels_to_defs.clear_raw(str(channel_id)) for channel_id in channel_ids])
             # Report success
             return await self._embed_msg(
                 ctx,
                 title=_("Deletion Successful"),
-                description=_(f"{definition_name} has been deleted."),
+                description=_("{definition_name} has been deleted.").format(definition_name=definition_name),
                 success=True
             )
 
@@ -601,13 +765,25 @@ class Emulator(commands.Cog):
         """
         if not local_path:
             await self._conf.local_path.set(str(cog_data_path()))
+            self._local_path = str(cog_data_path())
             return await self._embed_msg(
                 ctx,
                 title=_("Setting Changed"),
-                description=_(f"The localpath location has been reset to {cog_data_path(raw_name='Emulator').absolute()}"),
+                description=_("The localpath location has been reset to {path}").format(
+                    path=cog_data_path(raw_name="Emulator").absolute()),
                 success=True
             )
 
+        # Check that the path exists before asking for confirmation
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(self._io_pool, os.path.isdir, local_path):
+            return await self._embed_msg(
+                ctx,
+                title=_("Invalid Path"),
+                description=_("{local_path} does not seem like a valid path.").format(local_path=local_path),
+                error=True
+            )
+
         info_msg = _(
             "This setting is only for bot owners to set a localtracks folder location "
             "In the example below, the full path for 'ParentDirectory' "
@@ -624,50 +800,40 @@ class Emulator(commands.Cog):
         )
         info = await ctx.maybe_send_embed(info_msg)
 
-        start_adding_reactions(info, ReactionPredicate.YES_OR_NO_EMOJIS)
-        pred = ReactionPredicate.yes_or_no(info, ctx.author)
-        await ctx.bot.wait_for("reaction_add", check=pred)
+        confirmed = await self._confirm(ctx, info)
 
         # If user said no
-        if not pred.result:
+        if not confirmed:
             with contextlib.suppress(discord.HTTPException):
                 await info.delete()
             return
-        # Check that the path exists
-        if not os.path.isdir(local_path):
-            return await self._embed_msg(
-                ctx,
-                title=_("Invalid Path"),
-                description=_(f"{local_path} does not seem like a valid path."),
-                error=True
-            )
-        # It exists, so we set it.
+        # It exists and is confirmed, so we set it.
         await self._conf.local_path.set(local_path)
+        self._local_path = local_path
 
-        if not os.path.exists(await self.gb_path()):
+        if not await loop.run_in_executor(self._io_pool, os.path.exists, self.gb_path()):
             warn_msg = _(
-                    f"`{gb_path}` does not exist. "
+                    "`{gb_path}` does not exist. "
                     "The path will still be saved, but please check the path and "
-                    "create a gb folder in `{localfolder}` before attempting "
+                    "create a gb folder in `{local_path}` before attempting "
                     "to play games."
-                )
+                ).format(gb_path=self.gb_path(), local_path=local_path)
             await self._embed_msg(ctx, title=_("Invalid Environment"), description=warn_msg, error=True)
         else:
-            for subfolder in [await self.boots_dir(), await self.games_dir(), await self.saves_dir()]:
-                if not os.path.exists(subfolder):
-                    os.mkdir(subfolder)
+            await loop.run_in_executor(self._io_pool, self._make_dirs,
+                    [self.boots_dir(), self.games_dir(), self.saves_dir()])
 
         return await self._embed_msg(
                 ctx,
                 title=_("Setting Changed"),
-                description=_(f"The ROMs path location has been set to {local_path}"),
+                description=_("The ROMs path location has been set to {local_path}").format(local_path=local_path),
                 success=True
             )
 
 
     # Helper Functions
     # Path Related Functions
-    async def gb_path(self) -> str:
+    def gb_path(self) -> str:
         """Return '<local_path>/gb'
 
         Note this function does not check if this path exists.a
@@ -677,10 +843,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb'
         """
-        return os.path.join(await self._conf.local_path(), "gb")
+        return os.path.join(self._local_path, "gb")
 
 
-    async def boots_dir(self) -> str:
+    def boots_dir(self) -> str:
         """Return '<local_path>/gb/boots'
 
         Note this function does not check if this path exists.
@@ -690,10 +856,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/boots'
         """
-        return os.path.join(await self.gb_path(), "boots")
+        return os.path.join(self.gb_path(), "boots")
 
 
-    async def bootROM_path(self, bootROM:str) -> str:
+    def bootROM_path(self, bootROM:str) -> str:
         """Return '<local_path>/gb/boots/<bootROM>'
 
         Note this function does not check if this path exists.
@@ -708,10 +874,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/boots/<bootROM>'
         """
-        return os.path.join(await self.boots_dir(), bootROM)
+        return os.path.join(self.boots_dir(), bootROM)
 
 
-    async def games_dir(self) -> str:
+    def games_dir(self) -> str:
         """Return '<local_path>/gb/games'
 
         Note this function does not check if this path exists.
@@ -721,10 +887,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/games'
         """
-        return os.path.join(await self.gb_path(), "games")
+        return os.path.join(self.gb_path(), "games")
 
 
-    async def gameROM_path(self, gameROM) -> str:
+    def gameROM_path(self, gameROM) -> str:
         """Return '<local_path>/gb/games/<gameROM>'
 
         Note this function does not check if this path exists.
@@ -739,10 +905,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/games/<gameROM>'
         """
-        return os.path.join(await self.games_dir(), gameROM)
+        return os.path.join(self.games_dir(), gameROM)
 
 
-    async def saves_dir(self) -> str:
+    def saves_dir(self) -> str:
         """Return '<local_path>/gb/saves'
 
         Note this function does not check if this path exists.
@@ -752,10 +918,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/saves'
         """
-        return os.path.join(await self.gb_path(), "saves")
+        return os.path.join(self.gb_path(), "saves")
 
 
-    async def saves_definition_dir(self, def_name) -> str:
+    def saves_definition_dir(self, def_name) -> str:
         """Return '<local_path>/gb/saves/<def_name>'
 
         Note this function does not check if this path exists.
@@ -770,10 +936,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/saves/<def_name>'
         """
-        return os.path.join(await self.saves_dir(), def_name)
+        return os.path.join(self.saves_dir(), def_name)
 
 
-    async def state_save_dir(self, def_name) -> str:
+    def state_save_dir(self, def_name) -> str:
         """Return '<local_path>/gb/saves/<def_name>/states'
 
         Note this function does not check if this path exists.
@@ -788,10 +954,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/saves/<def_name>/states'
         """
-        return os.path.join(await self.saves_definition_dir(def_name), "states")
+        return os.path.join(self.saves_definition_dir(def_name), "states")
 
 
-    async def state_save_path(self, def_name, save_name) -> str:
+    def state_save_path(self, def_name, save_name) -> str:
         """Return '<local_path>/gb/saves/<def_name>/states/<save_name>'
 
         Note this function does not check if this path exists.
@@ -808,10 +974,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/saves/<def_name>/states/<save_name>'
         """
-        return os.path.join(await self.state_save_dir(def_name), save_name)
+        return os.path.join(self.state_save_dir(def_name), save_name)
 
 
-    async def screen_shots_save_dir(self, def_name) -> str:
+    def screen_shots_save_dir(self, def_name) -> str:
         """Return '<local_path>/gb/saves/<def_name>/screen_shots'
 
         Note this function does not check if this path exists.
@@ -826,10 +992,10 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/saves/<def_name>/screen_shots'
         """
-        return os.path.join(await self.saves_definition_dir(def_name), "screen_shots")
+        return os.path.join(self.saves_definition_dir(def_name), "screen_shots")
 
 
-    async def screen_shots_save_path(self, def_name, screen_shot_name) -> str:
+    def screen_shots_save_path(self, def_name, screen_shot_name) -> str:
         """Return '<local_path>/gb/saves/<def_name>/screen_shots/<save_name>'
 
         Note this function does not check if this path exists.
@@ -846,7 +1012,109 @@ class Emulator(commands.Cog):
         str
             '<local_path>/gb/saves/<def_name>/screen_shots/<screen_shot_name>'
         """
-        return os.path.join(await self.screen_shots_save_dir(def_name), screen_shot_name)
+        return os.path.join(self.screen_shots_save_dir(def_name), screen_shot_name)
+
+
+    # File System Functions
+    # These block, so they are meant to be run in an executor.
+    def _make_dirs(self, paths:List[str]) -> None:
+        """Create each folder in paths, along with any missing parents.
+
+        Parameters
+        ----------
+        paths: List[str]
+            The folders to create. Existing folders are left alone.
+        """
+        for path in paths:
+            os.makedirs(path, exist_ok=True)
+
+
+    def _write_file(self, path:str, data:bytes) -> None:
+        """Write data to the file at path, replacing anything there.
+
+        Parameters
+        ----------
+        path: str
+            The file to write.
+        data: bytes
+            The contents to write.
+        """
+        with open(path, "wb") as fout:
+            fout.write(data)
+
+
+    def _replace_file(self, path:str, data:bytes) -> None:
+        """Atomically replace the file at path with data.
+
+        The data is written next to it first, so the file is never left
+        half written.
+
+        Parameters
+        ----------
+        path: str
+            The file to replace.
+        data: bytes
+            The new contents.
+        """
+        self._write_file(path + ".tmp", data)
+        os.replace(path + ".tmp", path)
+
+
+    def _list_dir(self, path:str) -> List[str]:
+        """Return the names of the entries in a folder.
+
+        The folder is only read again once its modification time changes,
+        which is whenever an entry is added, removed or renamed.
+
+        Parameters
+        ----------
+        path: str
+            The folder to list.
+
+        Returns
+        -------
+        List[str]
+            The entry names, or None if the folder does not exist.
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._dir_listings.pop(path, None)
+            return None
+        cached = self._dir_listings.get(path, None)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with os.scandir(path) as entries:
+            items = [entry.name for entry in entries]
+        self._dir_listings[path] = (mtime, items)
+        return items
+
+
+    def _roms_message(self, boots:List[str], games:List[str]) -> str:
+        """Return the code block listing the boot and game ROMs.
+
+        Parameters
+        ----------
+        boots, games: List[str]
+            Contents of the boots and games folders, as from _list_dir.
+
+        Returns
+        -------
+        str
+            The tree of ROMs under '<local_path>/gb'.
+        """
+        parts = ["```", "gb"]
+        for name, items in [("boots", boots), ("games", games)]:
+            if items is None:
+                parts.append(f"|__ {name} :negative_squared_cross_mark: ")
+            else:
+                parts.append(f"|__ {name} ")
+                if len(items) == 0:
+                    parts.append("\t|__ <NOTHING> ")
+                else:
+                    parts.extend(f"\t|__ {item} " for item in items)
+        parts.append("```")
+        return "\n".join(parts)
 
 
     async def _send_message_to_registered_channels(self, definition_name:str, **kwargs) -> None:
@@ -861,20 +1129,97 @@ class Emulator(commands.Cog):
             it is intended to be used by other functions that do check if the 
             given definition_name exists.
         """
-        filepath = kwargs.get("filepath")
-        filename = kwargs.get("filename")
-        defs_to_channels = await self._conf.defs_to_channels()
-        for channel_id in defs_to_channels[definition_name]:
-            if filepath:
-                file = discord.File(filepath, filename=filename)
-            else:
-                file = None
-            await self._embed_msg(self.bot.get_channel(channel_id), file=file, **kwargs)
+        data = kwargs.pop("data", None)
+        filename = kwargs.pop("filename", None)
+        # Only _embed_msg takes these, and they don't change the embed.
+        kwargs.pop("error", None)
+        kwargs.pop("success", None)
+        channels = self._registered_channels(definition_name)
+        # The embed only differs by colour, so build it once per colour.
+        embeds: Dict[discord.Colour, discord.Embed] = {}
+        results = await asyncio.gather(
+                *[self._send_to_channel(channel, data, filename, embeds, **kwargs)
+                    for channel in channels],
+                return_exceptions=True)
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception):
+                log.error("Failed to send to channel %s for %s", channel.id, definition_name,
+                        exc_info=result)
+
+
+    async def _send_to_channel(self, channel:discord.TextChannel, data:bytes, filename:str,
+            embeds:Dict[discord.Colour, discord.Embed], **kwargs) -> None:
+        """Send an embedded message to one channel, within its rate limit.
+
+        Parameters
+        ----------
+        channel: discord.TextChannel
+            The channel to send to.
+        data: bytes
+            Contents of the file to attach, or None for no file.
+        filename: str
+            The name to give the attached file.
+        embeds: Dict[discord.Colour, discord.Embed]
+            Embeds already built for this message, by colour. Any built
+            here is added to it.
+        **kwargs
+            The embed's fields, as taken by _build_embed.
+        """
+        colour = await self._embed_colour(channel)
+        embed = embeds.get(colour, None)
+        if embed is None:
+            embed = embeds[colour] = _build_embed(colour,
+                    filename=filename if data is not None else None, **kwargs)
+        await self._send_limiters[channel.id].acquire()
+        # Each send consumes its file, so every channel gets its own.
+        file = discord.File(io.BytesIO(data), filename=filename) if data is not None else None
+        await channel.send(embed=embed, file=file)
+
+
+    def _definition_exists(self, definition_name:str) -> bool:
+        """Return True if a game definition with the given name exists.
+
+        Parameters
+        ----------
+        definition_name: str
+            The name of the game definition to look for.
+
+        Returns
+        -------
+        bool
+            If the definition exists.
+        """
+        return definition_name in self._game_defs
+
+
+    def _registered_channels(self, definition_name:str) -> List[discord.TextChannel]:
+        """Return the channels registered to the given definition name.
+
+        Channels the bot can no longer see are left out.
+
+        Parameters
+        ----------
+        definition_name: str
+            The name of the game being played by channels.
+
+        Returns
+        -------
+        List[discord.TextChannel]
+            The registered channels.
+        """
+        channels = [self.bot.get_channel(channel_id)
+                for channel_id in self._defs_to_channels.get(definition_name, ())]
+        return [channel for channel in channels if channel is not None]
 
 
     async def _save_main_state_file(self, definition_name: str) -> None:
         """Save the current state to the main state save file.
 
+        Nothing is written if the game has not run since it was last saved.
+        The state is serialized in the emulator's thread, then written to a
+        temporary file on the I/O pool and moved into place, so a crash
+        mid-save can't leave a half written state.
+
         Parameters
         ----------
         definition_name: str
@@ -882,7 +1227,37 @@ class Emulator(commands.Cog):
             Note that this function does not check if it exists, so it will crash
             if there is no existing instance.
         """
-        self._instances[definition_name].saveState(await self.state_save_path(definition_name, "main"))
+        if definition_name not in self._unsaved:
+            return
+        instance = self._instances[definition_name]
+
+        def serialize() -> bytes:
+            state = io.BytesIO()
+            instance.saveState(state)
+            return state.getvalue()
+
+        data = await self._run_in_emulator(definition_name, serialize)
+        await asyncio.get_running_loop().run_in_executor(self._io_pool, self._replace_file,
+                self.state_save_path(definition_name, "main"), data)
+        # Only once it's on disk, so a failed write is retried next save.
+        self._unsaved.discard(definition_name)
+
+
+    def _write_main_state_file(self, definition_name: str) -> None:
+        """Save the current state to the main state save file, blocking.
+
+        For when there is no event loop to hand the write to. It must be
+        run in the instance's emulator thread.
+
+        Parameters
+        ----------
+        definition_name: str
+            The name of the game to save.
+        """
+        state = io.BytesIO()
+        self._instances[definition_name].saveState(state)
+        self._replace_file(self.state_save_path(definition_name, "main"), state.getvalue())
+        self._unsaved.discard(definition_name)
 
 
     async def _load_main_state_file(self, definition_name: str) -> None:
@@ -898,8 +1273,14 @@ class Emulator(commands.Cog):
             Note that this function does not check if it exists, so it will crash
             if there is no existing instance.
         """
-        if os.path.exists(await self.state_save_path(definition_name, "main")):
-            self._instances[definition_name].loadState(await self.state_save_path(definition_name, "main"))
+        instance = self._instances[definition_name]
+        state_path = self.state_save_path(definition_name, "main")
+
+        def load() -> None:
+            if os.path.exists(state_path):
+                instance.loadState(state_path)
+
+        await self._run_in_emulator(definition_name, load)
 
 
     async def _send_screenshot(self, definition_name: str,  **kwargs) -> None:
@@ -912,15 +1293,26 @@ class Emulator(commands.Cog):
             Note that this function does not check if it exists, so it will crash
             if there is no existing instance.
         """
-        screenshot_path = await self.screen_shots_save_path(definition_name, f"{datetime.now()}.gif")
-        self._instances[definition_name].makeGIF(screenshot_path)
-        await self._send_message_to_registered_channels(
-                definition_name, filepath=screenshot_path, filename="gameplay.gif", **kwargs)
-
-
-    async def _button_usage_message(self, definition_name:str) -> str:
+        # Encode in memory, then keep a copy on disk while it's being sent.
+        gif = io.BytesIO()
+        await self._instances[definition_name].makeGIFAsync(gif, executor=self._io_pool,
+                captureExecutor=self._emulator_pools[definition_name])
+        data = gif.getvalue()
+        # Only the latest few are kept, overwriting the oldest.
+        number = next(self._screen_shot_counters[definition_name]) % _SCREEN_SHOTS_KEPT
+        screenshot_path = self.screen_shots_save_path(definition_name, f"{number}.gif")
+        await asyncio.gather(
+                asyncio.get_running_loop().run_in_executor(self._io_pool, self._write_file,
+                    screenshot_path, data),
+                self._send_message_to_registered_channels(
+                    definition_name, data=data, filename="gameplay.gif", **kwargs))
+
+
+    def _button_usage_message(self, definition_name:str) -> str:
         """Construct a help message to interacting with the emulator of the given definition name.
 
+        The message is cached until the definition's press or hold max changes.
+
         Parameters
         ----------
         definition_name: str
@@ -933,20 +1325,26 @@ class Emulator(commands.Cog):
         str
             Help message.
         """
-        game_defs = await self._conf.game_defs()
-        msg = "```\n"
-        msg += "Usage:\n"
-        msg += "---------------------------\n"
-        msg += "<button> p <number>\n"
-        msg += "press <button> <number> times\n"
-        msg += f"min: 1; max: {game_defs[definition_name]['pressMax']}\n"
-        msg += "---------------------------\n"
-        msg += "<button> h <number>\n"
-        msg += "hold <button> for <number> seconds\n"
-        msg += f"min: 0.5; max: {game_defs[definition_name]['holdMax']}\n"
-        msg += "---------------------------\n"
-        msg += f"Buttons: ({', '.join(sorted(self._instances[definition_name].buttonNames))})\n"
-        msg += "```\n"
+        msg = self._usage_messages.get(definition_name, None)
+        if msg is not None:
+            return msg
+        def_info = self._game_defs[definition_name]
+        msg = (
+            "```\n"
+            "Usage:\n"
+            "---------------------------\n"
+            "<button> p <number>\n"
+            "press <button> <number> times\n"
+            f"min: 1; max: {def_info['pressMax']}\n"
+            "---------------------------\n"
+            "<button> h <number>\n"
+            "hold <button> for <number> seconds\n"
+            f"min: 0.5; max: {def_info['holdMax']}\n"
+            "---------------------------\n"
+            f"Buttons: ({', '.join(sorted(self._instances[definition_name].buttonNames))})\n"
+            "```\n"
+        )
+        self._usage_messages[definition_name] = msg
         return msg
 
 
@@ -963,18 +1361,14 @@ class Emulator(commands.Cog):
             self._locks[definition_name] = asyncio.Lock()
         async with self._locks[definition_name]:
             # Perhaps the first time so create the folders.
-            if not os.path.exists(await self.saves_definition_dir(definition_name)):
-                os.mkdir(await self.saves_definition_dir(definition_name))
-
-            if not os.path.exists(await self.state_save_dir(definition_name)):
-                os.mkdir(await self.state_save_dir(definition_name))
-
-            if not os.path.exists(await self.screen_shots_save_dir(definition_name)):
-                os.mkdir(await self.screen_shots_save_dir(definition_name))
+            await asyncio.get_running_loop().run_in_executor(self._io_pool, self._make_dirs,
+                    [self.state_save_dir(definition_name), self.screen_shots_save_dir(definition_name)])
 
             # Does an instance already exist?
             if self._instances.get(definition_name, None) is None:
                 self._instances[definition_name] = GameBoy()
+                self._emulator_pools[definition_name] = ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix=f"emulator-{definition_name}")
 
             # Does a pattern for this already exist?
             if self._patterns.get(definition_name, None) is None:
@@ -982,23 +1376,35 @@ class Emulator(commands.Cog):
 
             # Check that it's not already running.
             if not self._instances[definition_name].isRunning:
-                game_defs = await self._conf.game_defs()
+                game_defs = self._game_defs
                 def_info = game_defs[definition_name]
                 # Start the emulator, but don't run it
-                self._instances[definition_name].start(
-                        bootROMPath=await self.bootROM_path(def_info["bootROM"]),
-                        gameROMPath=await self.gameROM_path(def_info["gameROM"]),
+                await self._run_in_emulator(definition_name, functools.partial(
+                        self._instances[definition_name].start,
+                        bootROMPath=self.bootROM_path(def_info["bootROM"]),
+                        gameROMPath=self.gameROM_path(def_info["gameROM"]),
                         numberOfSecondsToRun=0
-                    )
+                    ))
                 # Load the state file, if it exists
                 await self._load_main_state_file(definition_name)
-                # Now run the emulator 
-                self._instances[definition_name].runForXSeconds(60)
+                # Now run the emulator, a second at a time so that starting
+                # can be cancelled and a stop queued behind it isn't held up.
+                for _second in range(_WARMUP_SECONDS):
+                    await self._run_in_emulator(definition_name,
+                            self._instances[definition_name].runForXSeconds, 1)
+                self._unsaved.add(definition_name)
+
+                # Start taking input, before anything that could fail leaves
+                # a running game with nothing to play its input. The worker
+                # waits for the lock, so input is only played once started.
+                self._queues[definition_name] = asyncio.Queue(maxsize=_INPUT_QUEUE_SIZE)
+                self._pending_inputs[definition_name] = Counter()
+                self._workers[definition_name] = asyncio.create_task(self._input_worker(definition_name))
 
                 # Send a screenshot
                 await self._send_screenshot(definition_name,
-                        title=_(f"Started \"{definition_name}\""),
-                        description=_(await self._button_usage_message(definition_name)))
+                        title=_("Started \"{definition_name}\"").format(definition_name=definition_name),
+                        description=self._button_usage_message(definition_name))
 
 
     async def _stop_instance(self, definition_name:str):
@@ -1012,28 +1418,208 @@ class Emulator(commands.Cog):
         # Stop the instance
         # Lock it up, just in case someone jumps the gun.
         async with self._locks[definition_name]:
+            self._stop_input_worker(definition_name)
             if self._instances[definition_name].isRunning:
                 await self._save_main_state_file(definition_name)
-                self._instances[definition_name].stop()
-                info_msg = "```\n"
-                info_msg += f"{definition_name} has been stopped.\n"
-                info_msg += "```\n"
+                await self._run_in_emulator(definition_name, self._instances[definition_name].stop)
+                info_msg = _code_block(_("{definition_name} has been stopped.").format(
+                        definition_name=definition_name))
                 return await self._send_message_to_registered_channels(definition_name, 
-                        title=_("Instance Stopped"), description=_(info_msg), success=True)
+                        title=_("Instance Stopped"), description=info_msg, success=True)
+
+
+    async def _input_worker(self, definition_name:str) -> None:
+        """Play the queued button inputs for the given game.
+
+        This is the only place button input reaches the emulator, so the
+        instance is never driven by two inputs at once; on_message just
+        queues them. Inputs that arrive close together are played as one
+        batch, followed by a single run and screen shot. A batch stops short
+        of more play than the instance keeps screen shots of, and the rest
+        waits for the next one. It runs until cancelled by _stop_input_worker.
+
+        Parameters
+        ----------
+        definition_name: str
+            The name of the game to play the input of.
+        """
+        queue = self._queues[definition_name]
+        pending = self._pending_inputs[definition_name]
+        # Only as much play as the screen shot GIF can show goes in a batch.
+        batch_seconds = self._instances[definition_name].screenShotSeconds - _BATCH_RUN_SECONDS
+        # An input taken from the queue that didn't fit in the last batch
+        carried = None
+        while True:
+            inputs = [carried if carried is not None else await queue.get()]
+            carried = None
+            # Give anyone else a moment to chime in.
+            await asyncio.sleep(_INPUT_COALESCE_SECONDS)
+            seconds = _INPUT_SECONDS[inputs[0][3]](inputs[0][4])
+            while not queue.empty():
+                next_input = queue.get_nowait()
+                seconds += _INPUT_SECONDS[next_input[3]](next_input[4])
+                if seconds > batch_seconds:
+                    carried = next_input
+                    break
+                inputs.append(next_input)
+            # Their input is out of the queue, so they may send more.
+            for author_id, *_input in inputs:
+                pending[author_id] -= 1
+                if pending[author_id] <= 0:
+                    del pending[author_id]
+            try:
+                async with self._locks[definition_name]:
+                    instance = self._instances[definition_name]
+                    if not instance.isRunning:
+                        continue
+                    titles = await self._run_in_emulator(definition_name,
+                            self._play_inputs, instance, inputs)
+                    self._unsaved.add(definition_name)
+                    await self._save_main_state_file(definition_name)
+                    if len(titles) == 1:
+                        await self._send_screenshot(definition_name, title=titles[0])
+                    else:
+                        await self._send_screenshot(definition_name,
+                                title=_("Played {number} inputs").format(number=len(titles)),
+                                description="\n".join(titles))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Failed to play input for %s", definition_name)
+            finally:
+                for n in range(len(inputs)):
+                    queue.task_done()
+
+
+    def _play_inputs(self, instance:GameBoy, inputs:List[tuple]) -> List[str]:
+        """Play button inputs on an emulator, then let it run.
+
+        This blocks, so it is meant to be run in the instance's executor.
+
+        Parameters
+        ----------
+        instance: GameBoy
+            The emulator to play the inputs on.
+        inputs: List[tuple]
+            (author_id, display_name, button, action, num) for each input, in order.
+
+        Returns
+        -------
+        List[str]
+            A translated description of each input played.
+        """
+        titles = []
+        for author_id, display_name, button, action, num in inputs:
+            if action == 'p':
+                # Press button X times
+                for n in range(num):
+                    instance.pressButton(button)
+                titles.append(_("{name} pressed \"{button}\" {number} time(s)").format(
+                        name=display_name, button=button, number=num))
+            elif action == 'h':
+                # Hold button for X seconds
+                instance.holdButton(button, num)
+                titles.append(_("{name} held \"{button}\" for {number} second(s)").format(
+                        name=display_name, button=button, number=num))
+        instance.runForXSeconds(_BATCH_RUN_SECONDS)
+        return titles
+
+
+    async def _run_in_emulator(self, definition_name:str, func, *args):
+        """Run func(*args) in the given game's emulator thread.
+
+        Every instance has its own single thread, so calls into an emulator
+        never overlap and never block the event loop.
+
+        Parameters
+        ----------
+        definition_name: str
+            The name of the game whose thread to run in.
+        func: Callable
+            The blocking function to run.
+        *args
+            Arguments to give func.
+
+        Returns
+        -------
+        Any
+            What func returned.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+                self._emulator_pools[definition_name], func, *args)
+
+
+    def _stop_input_worker(self, definition_name:str) -> None:
+        """Stop taking input for the given game, dropping any that is queued.
+
+        Parameters
+        ----------
+        definition_name: str
+            The name of the game to stop taking input for.
+        """
+        worker = self._workers.pop(definition_name, None)
+        if worker is not None:
+            worker.cancel()
+        self._queues.pop(definition_name, None)
+        self._pending_inputs.pop(definition_name, None)
 
 
     async def _stop_all_instances(self):
         """Stop all instances that are currently running"""
-        # Start up all the auto load instances
-        for def_name in self._instances.keys():
-            await self._stop_instance(def_name)
+        # Each instance has its own lock, so they can all stop at once.
+        def_names = list(self._instances)
+        results = await asyncio.gather(*[self._stop_instance(def_name) for def_name in def_names],
+                return_exceptions=True)
+        for def_name, result in zip(def_names, results):
+            if isinstance(result, Exception):
+                log.error("Failed to stop %s", def_name, exc_info=result)
 
 
     async def _auto_load_instances(self):
         """Start all specified instances for auto loading."""
-        # Start up all the auto load instances
-        for def_name in await self._conf.auto_loads():
-            await self._start_instance(def_name)
+        # Start up all the auto load instances, a few at a time
+        semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+
+        async def start(def_name:str) -> None:
+            async with semaphore:
+                await self._start_instance(def_name)
+
+        def_names = list(dict.fromkeys(await self._conf.auto_loads()))
+        results = await asyncio.gather(*[start(def_name) for def_name in def_names],
+                return_exceptions=True)
+        for def_name, result in zip(def_names, results):
+            if isinstance(result, Exception):
+                log.error("Failed to auto load %s", def_name, exc_info=result)
+
+
+    async def _confirm(self, ctx: commands.Context, message: discord.Message) -> bool:
+        """Ask the command author to confirm with a yes or no reaction.
+
+        This waits on raw reaction events, so it still works once the
+        message has fallen out of the bot's message cache.
+
+        Parameters
+        ----------
+        ctx: commands.Context
+            The context of the command asking for confirmation.
+        message: discord.Message
+            The message to add the yes and no reactions to.
+
+        Returns
+        -------
+        bool
+            True if the author reacted yes, False if they reacted no.
+        """
+        yes, no = ReactionPredicate.YES_OR_NO_EMOJIS
+        start_adding_reactions(message, (yes, no))
+
+        def check(payload: discord.RawReactionActionEvent) -> bool:
+            return (payload.message_id == message.id
+                    and payload.user_id == ctx.author.id
+                    and str(payload.emoji) in (yes, no))
+
+        payload = await ctx.bot.wait_for("raw_reaction_add", check=check)
+        return str(payload.emoji) == yes
 
 
     def _create_regex_pattern(self, def_name:str) -> re.Pattern:
@@ -1056,43 +1642,69 @@ class Emulator(commands.Cog):
         return re.compile(re_string, re.IGNORECASE)
 
 
-    async def _embed_msg(self, ctx: commands.Context, **kwargs) -> None:
+    async def _embed_colour(self, ctx: commands.Context) -> discord.Colour:
+        """Return the bot's embed colour for ctx, reusing recent lookups.
+
+        The colour depends only on the guild, and it changes rarely, so
+        each guild's is kept for _EMBED_COLOUR_TTL seconds.
+
+        Parameters
+        ----------
+        ctx: commands.Context
+            Where the embed will be sent; anything with a guild attribute.
+
+        Returns
+        -------
+        discord.Colour
+            The colour to use.
+        """
+        guild = getattr(ctx, "guild", None)
+        key = guild.id if guild is not None else 0
+        now = time.monotonic()
+        cached = self._embed_colours.get(key, None)
+        if cached is not None and now - cached[1] < _EMBED_COLOUR_TTL:
+            return cached[0]
+        colour = await self.bot.get_embed_color(ctx)
+        self._embed_colours[key] = (colour, now)
+        return colour
+
+
+    async def _code_reply(self, ctx: commands.Context, title:str, text:str, **kwargs) -> None:
+        """Send an embedded message whose description is text in a code block.
+
+        Parameters
+        ----------
+        ctx: commands.Context
+            Where to send the message.
+        title: str
+            Title of the embed.
+        text: str
+            What goes in the code block.
+        **kwargs
+            Anything else _embed_msg takes.
+        """
+        return await self._embed_msg(ctx, title=title, description=_code_block(text), **kwargs)
+
+
+    async def _embed_msg(self, ctx: commands.Context, *, colour:discord.Colour=None,
+            color:discord.Colour=None, error:bool=False, success:bool=False,
+            file:discord.File=None, **fields) -> None:
         """Assemble and send an embedded message.
         Credit for this goes to the Audio cog within the core RedBot cogs.
 
         Parameters
         ----------
-        definition_name: str
-            The name of the game being played by channels.
-            Note that this function does not check if it exists, so it will
-            simply send to no channels if it doesn't exist. This is because
-            it is intended to be used by other functions that do check if the 
-            given definition_name exists.
+        ctx: commands.Context
+            Where to send the message; anything with a send method.
+        colour, color: discord.Colour
+            Colour of the embed. Defaults to the bot's embed colour for ctx.
+        error, success: bool
+            Unused; kept so callers can say what kind of message it is.
+        file: discord.File
+            File to attach and show as the embed's image.
+        **fields
+            The embed's other fields, as taken by _build_embed.
         """
-        colour = kwargs.get("colour") or kwargs.get("color") or await self.bot.get_embed_color(ctx)
-        error = kwargs.get("error", False)
-        success = kwargs.get("success", False)
-        title = kwargs.get("title", EmptyEmbed) or EmptyEmbed
-        _type = kwargs.get("type", "rich") or "rich"
-        url = kwargs.get("url", EmptyEmbed) or EmptyEmbed
-        description = kwargs.get("description", EmptyEmbed) or EmptyEmbed
-        timestamp = kwargs.get("timestamp")
-        footer = kwargs.get("footer")
-        thumbnail = kwargs.get("thumbnail")
-        file = kwargs.get("file")
-        contents = dict(title=title, type=_type, url=url, description=description)
-        embed = kwargs.get("embed").to_dict() if hasattr(kwargs.get("embed"), "to_dict") else {}
-        colour = embed.get("color") if embed.get("color") else colour
-        contents.update(embed)
-        if timestamp and isinstance(timestamp, datetime.datetime):
-            contents["timestamp"] = timestamp
-        embed = discord.Embed.from_dict(contents)
-        embed.color = colour
-        if footer:
-            embed.set_footer(text=footer)
-        if thumbnail:
-            embed.set_thumbnail(url=thumbnail)
-        if file:
-            embed.set_image(url=f"attachment://{file.filename}")
+        colour = colour or color or await self._embed_colour(ctx)
+        embed = _build_embed(colour, filename=file.filename if file else None, **fields)
         return await ctx.send(embed=embed, file=file)
-
@@ -5,28 +5,56 @@ Controller Interface For PyBoy
 :license: GPL-3.0, see LICENSE for more details.
 """
 import logging
+import numpy as np
 import os
-from PIL import Image
 from pyboy import windowevent, PyBoy
 from .abstract_emulator import ButtonCode, AbastractEmulator
 
 log = logging.getLogger("red.emulator")
 
+# PyBoy's default shades, lightest to darkest. Any other colour a ROM
+# produces is added to the palette when it first appears.
+_SCREEN_PALETTE = (
+  (0xFF, 0xFF, 0xFF),
+  (0x99, 0x99, 0x99),
+  (0x55, 0x55, 0x55),
+  (0x00, 0x00, 0x00),
+)
+
+# The buttons are the same for every instance, so they are only made once.
+_BUTTONS = (
+  ButtonCode("A", windowevent.PRESS_BUTTON_A, windowevent.RELEASE_BUTTON_A),
+  ButtonCode("B", windowevent.PRESS_BUTTON_B, windowevent.RELEASE_BUTTON_B),
+  ButtonCode("Se", windowevent.PRESS_BUTTON_SELECT, windowevent.RELEASE_BUTTON_SELECT),
+  ButtonCode("Select", windowevent.PRESS_BUTTON_SELECT, windowevent.RELEASE_BUTTON_SELECT),
+  ButtonCode("St", windowevent.PRESS_BUTTON_START, windowevent.RELEASE_BUTTON_START),
+  ButtonCode("Start", windowevent.PRESS_BUTTON_START, windowevent.RELEASE_BUTTON_START),
+  ButtonCode("U", windowevent.PRESS_ARROW_UP, windowevent.RELEASE_ARROW_UP),
+  ButtonCode("Up", windowevent.PRESS_ARROW_UP, windowevent.RELEASE_ARROW_UP),
+  ButtonCode("D", windowevent.PRESS_ARROW_DOWN, windowevent.RELEASE_ARROW_DOWN),
+  ButtonCode("Down", windowevent.PRESS_ARROW_DOWN, windowevent.RELEASE_ARROW_DOWN),
+  ButtonCode("L", windowevent.PRESS_ARROW_LEFT, windowevent.RELEASE_ARROW_LEFT),
+  ButtonCode("Left", windowevent.PRESS_ARROW_LEFT, windowevent.RELEASE_ARROW_LEFT),
+  ButtonCode("R", windowevent.PRESS_ARROW_RIGHT, windowevent.RELEASE_ARROW_RIGHT),
+  ButtonCode("Right", windowevent.PRESS_ARROW_RIGHT, windowevent.RELEASE_ARROW_RIGHT),
+)
+
+
 
 class GameBoy(AbastractEmulator):
   # Buttons
-  def _abstractHoldButton(self, button:ButtonCode, numberOfSeconds:float) -> None:
-    """Holds the specified button for the specified time.
+  def _abstractHoldButtonFrames(self, button:ButtonCode, numberOfFrames:int) -> None:
+    """Holds the specified button for the specified number of frames.
 
     Parameters
     ----------
     button: ButtonCode
         Button to be held down.
-    numberOfSeconds: float
-        Number of seconds to hold this button.
+    numberOfFrames: int
+        Number of frames to hold this button.
     """
     self._pyboy.send_input(button.pressCode)
-    self.runForXSeconds(numberOfSeconds)
+    self.runForXFrames(numberOfFrames)
     self._pyboy.send_input(button.releaseCode)
     self.runForXSeconds(1)
 
@@ -47,111 +75,13 @@ class GameBoy(AbastractEmulator):
 
   # Magic methods
   def __init__(self, screenWidth:int=160, screenHeight:int=144):
-    super().__init__(60)
+    super().__init__(screenWidth, screenHeight, 60, screenPalette=_SCREEN_PALETTE)
 
     self._pyboy = None
-    self._screenWidth = 160
-    self._screenHeight = 144
 
     # Button registration
-    self._registerButton(
-      ButtonCode(
-        "A",
-        windowevent.PRESS_BUTTON_A,
-        windowevent.RELEASE_BUTTON_A
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "B",
-        windowevent.PRESS_BUTTON_B,
-        windowevent.RELEASE_BUTTON_B
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "Se",
-        windowevent.PRESS_BUTTON_SELECT,
-        windowevent.RELEASE_BUTTON_SELECT
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "Select",
-        windowevent.PRESS_BUTTON_SELECT,
-        windowevent.RELEASE_BUTTON_SELECT
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "St",
-        windowevent.PRESS_BUTTON_START,
-        windowevent.RELEASE_BUTTON_START
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "Start",
-        windowevent.PRESS_BUTTON_START,
-        windowevent.RELEASE_BUTTON_START
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "U",
-        windowevent.PRESS_ARROW_UP,
-        windowevent.RELEASE_ARROW_UP
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "Up",
-        windowevent.PRESS_ARROW_UP,
-        windowevent.RELEASE_ARROW_UP
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "D",
-        windowevent.PRESS_ARROW_DOWN,
-        windowevent.RELEASE_ARROW_DOWN
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "Down",
-        windowevent.PRESS_ARROW_DOWN,
-        windowevent.RELEASE_ARROW_DOWN
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "L",
-        windowevent.PRESS_ARROW_LEFT,
-        windowevent.RELEASE_ARROW_LEFT
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "Left",
-        windowevent.PRESS_ARROW_LEFT,
-        windowevent.RELEASE_ARROW_LEFT
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "R",
-        windowevent.PRESS_ARROW_RIGHT,
-        windowevent.RELEASE_ARROW_RIGHT
-      )
-    )
-    self._registerButton(
-      ButtonCode(
-        "Right",
-        windowevent.PRESS_ARROW_RIGHT,
-        windowevent.RELEASE_ARROW_RIGHT
-      )
-    )
+    for button in _BUTTONS:
+      self._registerButton(button)
 
 
   # Running
@@ -161,15 +91,15 @@ class GameBoy(AbastractEmulator):
 
 
   # Screenshots
-  def _abstractTakeScreenShot(self) -> Image:
+  def _abstractTakeScreenShotInto(self, buffer:np.ndarray) -> None:
     """Takes screen shot of emulator
 
-    Returns
-    -------
-    Image
-        Image object of the screen shot.
+    Parameters
+    ----------
+    buffer: np.ndarray
+        (height, width, 3) uint8 array to write the screen shot into.
     """
-    return self._pyboy.get_screen_image()
+    buffer[:] = self._pyboy.get_screen_image()
 
 
   # Starting
@@ -206,13 +136,17 @@ class GameBoy(AbastractEmulator):
           self._pyboy.load_state(fin)
 
 
-  def saveState(self, state_file_path:str) -> None:
+  def saveState(self, state_file_path) -> None:
       """Save a save state file.
 
       Parameters:
-      state_file_path: str
-        File path to the state file to save.
+      state_file_path: str or file object
+        File path to the state file to save, or a binary file object to
+        write the state to.
       """
+      if hasattr(state_file_path, "write"):
+          self._pyboy.save_state(state_file_path)
+          return
       with open(state_file_path, "wb") as fout:
           self._pyboy.save_state(fout)
 